@@ -0,0 +1,28 @@
+"""
+JPEG EXIF 헬퍼 (numpy/cv2 의존성 없음)
+"""
+
+
+def jpeg_exif_orientation(data) -> int:
+    """
+    JPEG APP1(Exif) 세그먼트에서 Orientation 태그를 읽음. 없으면 1.
+    """
+    i = 2
+    n = len(data)
+    while i + 4 <= n and data[i] == 0xFF:
+        marker = data[i + 1]
+        if marker in (0xD9, 0xDA):  # EOI / SOS 이후엔 메타데이터 없음
+            break
+        seg_len = int.from_bytes(data[i + 2:i + 4], "big")
+        if marker == 0xE1 and data[i + 4:i + 10] == b"Exif\x00\x00":
+            tiff = i + 10
+            endian = "little" if data[tiff:tiff + 2] == b"II" else "big"
+            ifd = tiff + int.from_bytes(data[tiff + 4:tiff + 8], endian)
+            count = int.from_bytes(data[ifd:ifd + 2], endian)
+            for k in range(count):
+                e = ifd + 2 + k * 12
+                if int.from_bytes(data[e:e + 2], endian) == 0x0112:
+                    return int.from_bytes(data[e + 8:e + 10], endian)
+            return 1
+        i += 2 + seg_len
+    return 1
@@ -1,10 +1,35 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# /embed 추론을 돌리는 스레드 수 (onnxruntime Run()은 GIL을 풀기 때문에 요청 단위 병렬 처리 가능)
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", str(os.cpu_count() or 1)))
+
+# ONNXRuntime intra-op 스레드 수 (기본: 코어를 EMBED_WORKERS끼리 나눠 씀 → 보통 1)
+ORT_INTRA_OP_THREADS = int(os.getenv(
+    "ORT_INTRA_OP_THREADS", str(max(1, (os.cpu_count() or 1) // max(1, EMBED_WORKERS)))
+))
+
+# numpy/cv2/onnxruntime import 전에 설정해야 OpenMP/MKL 스레드 풀에 반영됨
+os.environ.setdefault("OMP_NUM_THREADS", str(ORT_INTRA_OP_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(ORT_INTRA_OP_THREADS))
+
 from fastapi import FastAPI, UploadFile, File, HTTPException
+# embedding(float32 ndarray)을 tolist() 없이 orjson(OPT_SERIALIZE_NUMPY)으로 바로 직렬화
+from fastapi.responses import ORJSONResponse
 import numpy as np
 import cv2
-import os
-from typing import Dict, Tuple, List, Any
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Tuple, List, Any, Optional
+
+from exif import jpeg_exif_orientation
+from model_router import select_models
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
 # -----------------------------
 # Tunables (ENV로 조절 가능)
@@ -19,57 +44,271 @@ DET_SIZES = [
 # 탐지 임계치(높을수록 엄격). 실패하면 아래로 내려가며 재시도
 DET_THRESH_SCHEDULE = [0.55, 0.45, 0.38, 0.32]
 
+# detector는 가장 낮은 임계치로 한 번만 돌리고, 위 스케줄은 score 필터로 재현
+DET_THRESH_FLOOR = min(DET_THRESH_SCHEDULE)
+
 # 너무 큰 이미지면 속도를 위해 먼저 축소 (긴 변 기준)
 MAX_LONG_EDGE_FOR_FIRST_PASS = int(os.getenv("MAX_LONG_EDGE_FOR_FIRST_PASS", "2200"))
 
-# 실패 시 작은 얼굴 구출용 업스케일 배율 (너무 크면 CPU 부담)
-UPSCALE_ON_FAIL = float(os.getenv("UPSCALE_ON_FAIL", "1.35"))
+# 실패 시 작은 얼굴 구출용 det_size (이미지를 키우는 대신 detector 입력을 키움)
+# SCRFD는 fully-convolutional이라 32의 배수면 어떤 입력 크기든 가능
+RESCUE_DET_SIZES = [
+    (1600, 1600),
+]
 
 # 최종적으로도 너무 큰 이미지는 이 값 넘기지 않게 제한(메모리/속도)
 ABS_MAX_LONG_EDGE = int(os.getenv("ABS_MAX_LONG_EDGE", "3200"))
 
+# 업로드 최대 크기 (초과 시 디코딩 전에 413으로 거절 → 요청당 메모리 상한)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+# /embed 응답 LRU 캐시 크기 (0이면 비활성)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "1024"))
+
+# 1차 패스 이미지의 실제 긴 변 (ABS_MAX_LONG_EDGE보다 클 수 없음)
+FIRST_PASS_LONG_EDGE = min(ABS_MAX_LONG_EDGE, MAX_LONG_EDGE_FOR_FIRST_PASS)
+
+# 서버 시작 시 모델 로딩 + 첫 det_size(640)로 warmup (끄면 첫 요청 때 로딩)
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
 # InsightFace 모델 (CPU)
+# quantize_models.py로 만든 int8 팩을 쓰려면 buffalo_l_int8 (opt-in, 저장된 FP32 임베딩과 호환 안 됨)
 MODEL_NAME = os.getenv("INSIGHTFACE_MODEL", "buffalo_l")
 
-# providers 고정(CPU)
-PROVIDERS = ["CPUExecutionProvider"]
+# 모델 파일 위치. 이미지에 미리 구워두거나 공유 볼륨을 가리키게 하면
+# 런타임 다운로드가 없고, 여러 컨테이너/워커가 같은 파일을 재사용
+INSIGHTFACE_ROOT = os.path.expanduser(os.getenv("INSIGHTFACE_ROOT", "~/.insightface"))
+
+# onnxruntime providers (콤마 구분, 예: CUDAExecutionProvider,CPUExecutionProvider)
+PROVIDER_NAMES = [p.strip() for p in os.getenv("ORT_PROVIDERS", "CPUExecutionProvider").split(",") if p.strip()]
+
+# provider별 옵션
+PROVIDER_OPTIONS: Dict[str, Dict[str, str]] = {
+    # cudnn 기본값(EXHAUSTIVE)은 첫 추론 때 conv 알고리즘 탐색으로 수 초씩 걸림
+    "CUDAExecutionProvider": {
+        "cudnn_conv_algo_search": "HEURISTIC",
+        "arena_extend_strategy": "kSameAsRequested",
+    },
+    # Intel CPU: onnxruntime-openvino 설치 후 ORT_PROVIDERS=OpenVINOExecutionProvider,CPUExecutionProvider
+    # (구버전 onnxruntime-openvino는 CPU_FP32 형식)
+    # OpenVINO 스레드 수는 SessionOptions.intra_op_num_threads가 아니라 이 옵션으로 지정
+    "OpenVINOExecutionProvider": {
+        "device_type": os.getenv("OPENVINO_DEVICE_TYPE", "CPU"),
+        "num_of_threads": str(ORT_INTRA_OP_THREADS),
+    },
+}
+
+USE_OPENVINO = "OpenVINOExecutionProvider" in PROVIDER_NAMES
+
+PROVIDERS: List[Any] = [
+    (name, PROVIDER_OPTIONS[name]) if name in PROVIDER_OPTIONS else name
+    for name in PROVIDER_NAMES
+]
+
+# /embed는 bbox/det_score/embedding만 쓰므로 detection + recognition만 로딩
+# (landmark_2d_106, landmark_3d_68, genderage는 메모리/CPU 낭비)
+ALLOWED_MODULES = ["detection", "recognition"]
 
 # -----------------------------
-# InsightFace FaceAnalysis 캐시
-# det_size/threshold 조합별로 캐싱
+# InsightFace 모델 캐시
+# detection + recognition 세션 1세트만 유지
+# (SCRFD는 detect()마다 input_size를 받으므로 det_size별 인스턴스가 필요 없음)
 # -----------------------------
-_face_apps: Dict[Tuple[int, int, float], Any] = {}
+_face_app: Optional["FaceModels"] = None
+_face_app_lock = threading.Lock()
 
-def get_face_app(det_size: Tuple[int, int], det_thresh: float):
+def get_face_app() -> "FaceModels":
     """
-    det_size, det_thresh 조합별로 FaceAnalysis 인스턴스를 캐싱.
+    FaceModels 인스턴스를 1회만 로딩해서 재사용.
+    (여러 스레드가 동시에 처음 요청해도 한 번만 로딩)
     """
-    global _face_apps
-    key = (det_size[0], det_size[1], float(det_thresh))
-    if key in _face_apps:
-        return _face_apps[key]
-
-    from insightface.app import FaceAnalysis
+    global _face_app
+    if _face_app is not None:
+        return _face_app
 
-    fa = FaceAnalysis(name=MODEL_NAME, providers=PROVIDERS)
-    fa.prepare(ctx_id=0, det_size=det_size)
+    with _face_app_lock:
+        if _face_app is None:
+            _face_app = load_face_app()
+        return _face_app
 
-    # FaceAnalysis는 내부 detector threshold를 이 속성으로 받는 경우가 많음
-    # (버전에 따라 다를 수 있어, 실패해도 무시하도록 try)
-    try:
-        fa.det_thresh = float(det_thresh)
-    except Exception:
-        pass
+class FaceModels:
+    """
+    FaceAnalysis 대신 쓰는 detection(SCRFD) + recognition(ArcFace) 묶음.
+    model_zoo가 만든 세션을 버리고 다시 만들지 않도록, 튜닝된 세션을 직접 만들어 넘김.
+    """
+    def __init__(self, models: Dict[str, Any]):
+        if "detection" not in models:
+            raise RuntimeError(f"detection model not found in {MODEL_NAME}")
+        self.models = models
+        self.det_model = models["detection"]
+
+def load_face_app() -> FaceModels:
+    import glob
+    import onnxruntime as ort
+    from insightface.model_zoo.arcface_onnx import ArcFaceONNX
+    from insightface.model_zoo.scrfd import SCRFD
+    from insightface.utils.storage import ensure_available
+
+    model_dir = ensure_available("models", MODEL_NAME, root=INSIGHTFACE_ROOT)
+    so = make_session_options()
+    model_classes = {"detection": SCRFD, "recognition": ArcFaceONNX}
+
+    # insightface ModelRouter와 같은 기준으로 detection/recognition만 고르고
+    # landmark/genderage 등은 세션을 바로 버림
+    selected = select_models(
+        sorted(glob.glob(os.path.join(model_dir, "*.onnx"))),
+        lambda f: ort.InferenceSession(f, sess_options=so, providers=PROVIDERS),
+        ALLOWED_MODULES,
+    )
+    models: Dict[str, Any] = {
+        taskname: model_classes[taskname](onnx_file, session)
+        for taskname, (onnx_file, session) in selected.items()
+    }
 
-    _face_apps[key] = fa
+    fa = FaceModels(models)
+    # detector는 항상 가장 낮은 임계치로 돌리고 스케줄은 score 필터로 처리하므로
+    # det_thresh는 prepare 때 한 번만 설정 (요청마다 공유 인스턴스를 수정하지 않음)
+    for taskname, model in fa.models.items():
+        if taskname == "detection":
+            # input_size는 detect()에 det_size를 넘기지 않을 때의 기본값
+            model.prepare(0, input_size=DET_SIZES[0], det_thresh=DET_THRESH_FLOOR)
+        else:
+            model.prepare(0)
+    warmup_face_app(fa, DET_SIZES[0])
     return fa
 
+def warmup_face_app(fa, det_size: Tuple[int, int]) -> None:
+    """
+    더미 입력으로 detection/recognition을 한 번씩 실행.
+    (CUDA 커널/메모리 arena 초기화 비용을 첫 요청이 떠안지 않도록)
+    """
+    dummy = np.zeros((det_size[1], det_size[0], 3), dtype=np.uint8)
+    fa.det_model.detect(dummy, input_size=det_size, max_num=0, metric="default")
+    rec = fa.models.get("recognition")
+    if rec is not None:
+        size = rec.input_size[0]
+        rec.get_feat([np.zeros((size, size, 3), dtype=np.uint8)])
+
+def make_session_options():
+    import onnxruntime as ort
+
+    so = ort.SessionOptions()
+    so.intra_op_num_threads = ORT_INTRA_OP_THREADS
+    # OpenVINO EP는 자체 그래프 최적화를 하고, ORT가 fusion한 op는 CPU EP로 떨어질 수 있어서 끔
+    so.graph_optimization_level = (
+        ort.GraphOptimizationLevel.ORT_DISABLE_ALL if USE_OPENVINO
+        else ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    )
+    so.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    return so
+
+def detect_candidates(fa, img: np.ndarray, det_size: Tuple[int, int]):
+    """
+    detector(SCRFD)만 det_size 입력으로 실행해서 DET_THRESH_FLOOR 이상인 (bboxes, kpss)를 반환.
+    bboxes: (N, 5) = x1, y1, x2, y2, det_score
+    """
+    bboxes, kpss = fa.det_model.detect(img, input_size=det_size, max_num=0, metric="default")
+    return bboxes, kpss
+
+def embed_candidates(fa, img: np.ndarray, bboxes: np.ndarray, kpss) -> list:
+    """
+    탐지가 확정된 얼굴에 대해서만 recognition(임베딩)을 실행.
+    (fa.get()과 달리 실패한 threshold 시도마다 임베딩을 돌리지 않음)
+    """
+    from insightface.app.common import Face
+    from insightface.utils import face_align
+
+    faces = [
+        Face(
+            bbox=bboxes[i, 0:4],
+            kps=kpss[i] if kpss is not None else None,
+            det_score=bboxes[i, 4],
+        )
+        for i in range(bboxes.shape[0])
+    ]
+
+    rec = fa.models.get("recognition")
+    if rec is not None and faces:
+        # 얼굴마다 ONNX를 따로 호출하지 않고, 정렬된 112x112 crop을 모아 한 배치로 추론
+        # (ArcFace onnx는 batch 차원이 dynamic)
+        crops = [face_align.norm_crop(img, landmark=f.kps, image_size=rec.input_size[0]) for f in faces]
+        feats = rec.get_feat(crops)
+        for face, feat in zip(faces, feats):
+            face.embedding = feat.flatten()
+    return faces
+
 # -----------------------------
 # Utils
 # -----------------------------
-def imdecode_bytes(data: bytes):
-    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
-    return img
+# libturbojpeg가 있으면 JPEG는 turbojpeg(SIMD IDCT)로 디코딩, 없으면 cv2로 fallback
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJFLAG_FASTDCT
+    _turbo = TurboJPEG()
+except Exception as e:
+    logger.warning("turbojpeg unavailable, falling back to cv2.imdecode for JPEG: %s", e)
+    _turbo = None
+
+# EXIF Orientation(1~8) -> 정방향으로 돌리는 변환
+# (cv2.imdecode는 자동 적용하지만 turbojpeg는 적용하지 않으므로 직접 처리)
+_EXIF_TRANSFORMS = {
+    2: lambda im: cv2.flip(im, 1),
+    3: lambda im: cv2.rotate(im, cv2.ROTATE_180),
+    4: lambda im: cv2.flip(im, 0),
+    5: lambda im: cv2.transpose(im),
+    6: lambda im: cv2.rotate(im, cv2.ROTATE_90_CLOCKWISE),
+    7: lambda im: cv2.flip(cv2.transpose(im), -1),
+    8: lambda im: cv2.rotate(im, cv2.ROTATE_90_COUNTERCLOCKWISE),
+}
+
+def is_jpeg(data) -> bool:
+    return data[:2] == b"\xff\xd8"
+
+def jpeg_scale_denom(data: bytes, max_long_edge: int) -> int:
+    """
+    디코딩 결과의 긴 변이 max_long_edge 이상으로 남는 가장 큰 1/N 배율 선택.
+    (libjpeg-turbo scaled IDCT: 축소가 entropy decode 단계에서 거의 공짜)
+    """
+    w, h, _, _ = _turbo.decode_header(data)
+    long_edge = max(w, h)
+    for denom in (8, 4, 2):
+        if (1, denom) in _turbo.scaling_factors and long_edge / denom >= max_long_edge:
+            return denom
+    return 1
+
+def imdecode_bytes(data: bytes, max_long_edge: Optional[int] = None) -> Tuple[Optional[np.ndarray], bool]:
+    """
+    이미지 디코딩. max_long_edge를 주면 긴 변이 그 이하가 되도록 축소까지 처리.
+    JPEG는 디코더 안에서 1/2, 1/4, 1/8로 먼저 줄인 뒤 INTER_AREA로 정확히 맞춤.
+    반환: (이미지 또는 None, 원본보다 축소했는지)
+    """
+    img = None
+    downscaled = False
+    if _turbo is not None and is_jpeg(data):
+        try:
+            denom = jpeg_scale_denom(data, max_long_edge) if max_long_edge else 1
+            img = _turbo.decode(
+                data,
+                pixel_format=TJPF_BGR,
+                scaling_factor=(1, denom) if denom > 1 else None,
+                flags=TJFLAG_FASTDCT,
+            )
+            downscaled = denom > 1
+        except Exception:
+            img = None  # CMYK 등 turbojpeg가 못 푸는 JPEG -> cv2로
+        if img is not None:
+            transform = _EXIF_TRANSFORMS.get(jpeg_exif_orientation(data))
+            if transform:
+                img = transform(img)
+
+    if img is None:
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+    if img is not None and max_long_edge:
+        resized = resize_long_edge(img, max_long_edge)
+        downscaled = downscaled or resized is not img
+        img = resized
+    return img, downscaled
 
 def resize_long_edge(img: np.ndarray, max_long_edge: int) -> np.ndarray:
     h, w = img.shape[:2]
@@ -81,151 +320,243 @@ def resize_long_edge(img: np.ndarray, max_long_edge: int) -> np.ndarray:
     nw = max(1, int(round(w * scale)))
     return cv2.resize(img, (nw, nh), interpolation=cv2.INTER_AREA)
 
-def upscale(img: np.ndarray, factor: float) -> np.ndarray:
-    if factor <= 1.0:
-        return img
-    h, w = img.shape[:2]
-    nh = max(1, int(round(h * factor)))
-    nw = max(1, int(round(w * factor)))
-    # 업스케일은 INTER_CUBIC이 보통 유리
-    return cv2.resize(img, (nw, nh), interpolation=cv2.INTER_CUBIC)
-
-def face_area(face) -> float:
-    x1, y1, x2, y2 = face.bbox
-    return float(max(0.0, (x2 - x1)) * max(0.0, (y2 - y1)))
-
-def face_center_distance_norm(face, img_w: int, img_h: int) -> float:
-    """
-    이미지 중앙에서 얼굴 중심까지의 거리(0~1 근사)
-    셀카는 중앙 근처 얼굴이 대표일 확률이 높아서 가중치로 사용.
-    """
-    x1, y1, x2, y2 = face.bbox
-    cx = float(x1 + x2) / 2.0
-    cy = float(y1 + y2) / 2.0
-    icx = img_w / 2.0
-    icy = img_h / 2.0
-    dx = (cx - icx) / float(max(1.0, img_w))
-    dy = (cy - icy) / float(max(1.0, img_h))
-    dist = (dx * dx + dy * dy) ** 0.5
-    # dist는 대략 0~0.7 사이가 흔함. 0~1로 clamp
-    return float(min(1.0, max(0.0, dist)))
-
-def pick_best_face(faces: list, img_w: int, img_h: int):
+def pick_best_index(bboxes: np.ndarray, det_scores: np.ndarray, img_w: int, img_h: int) -> int:
     """
     대표 얼굴 선택:
     - det_score 높을수록 좋음
     - 면적(크기) 클수록 좋음 (단체사진에서도 본인 얼굴이 아주 작을 수 있으므로, 너무 면적만 보지 않음)
     - 중앙 가까울수록 가산 (셀카에서 매우 유리)
     점수 = det_score * 0.70 + sqrt(area_norm) * 0.25 + (1 - center_dist) * 0.05
+    bboxes: (N, 4), det_scores: (N,) -> 최고 점수 얼굴의 index
     """
-    if not faces:
+    img_w_f = float(max(1, img_w))
+    img_h_f = float(max(1, img_h))
+    img_area = float(max(1, img_w * img_h))
+    b = bboxes
+
+    # 면적 (0~1로 정규화 후 sqrt: 작은 얼굴도 완전 죽이지 않도록)
+    area = np.maximum(0.0, b[:, 2] - b[:, 0]) * np.maximum(0.0, b[:, 3] - b[:, 1])
+    area_term = np.sqrt(np.clip(area / img_area, 0.0, 1.0))
+
+    # 이미지 중앙에서 얼굴 중심까지의 거리 (대략 0~0.7, 0~1로 clamp)
+    dx = ((b[:, 0] + b[:, 2]) * 0.5 - img_w_f / 2.0) / img_w_f
+    dy = ((b[:, 1] + b[:, 3]) * 0.5 - img_h_f / 2.0) / img_h_f
+    center_term = 1.0 - np.clip(np.sqrt(dx * dx + dy * dy), 0.0, 1.0)
+
+    scores = det_scores * 0.70 + area_term * 0.25 + center_term * 0.05
+    return int(scores.argmax())
+
+def normalize_embeddings(embs: np.ndarray) -> np.ndarray:
+    # (N, D) 임베딩을 행 단위로 L2 정규화 (einsum 한 번 + 나눗셈 한 번)
+    e = np.ascontiguousarray(embs, dtype=np.float32)
+    norms = np.sqrt(np.einsum("ij,ij->i", e, e)) + np.float32(1e-12)
+    return e / norms[:, None]
+
+def build_response(faces: list, img_w: int, img_h: int) -> Optional[Dict[str, Any]]:
+    """
+    faces -> 응답의 얼굴 관련 필드 (faces payload + 대표 얼굴).
+    embedding 정규화와 대표 얼굴 점수를 (N, ...) 배열로 한 번에 계산.
+    embedding이 있는 얼굴이 없으면 None.
+    """
+    embedded = [f for f in faces if getattr(f, "embedding", None) is not None]
+    if not embedded:
         return None
 
-    img_area = float(max(1, img_w * img_h))
+    bboxes = np.stack([f.bbox for f in embedded]).astype(np.float32)  # (N, 4)
+    det_scores = np.array([getattr(f, "det_score", 0.0) for f in embedded], dtype=np.float32)
+    embeddings = normalize_embeddings(np.stack([f.embedding for f in embedded]))  # (N, 512)
+
+    best = pick_best_index(bboxes, det_scores, img_w, img_h)
+
+    bbox_list = bboxes.tolist()
+    score_list = det_scores.tolist()
+    payload_faces = [
+        {
+            "bbox": bbox_list[i],
+            "det_score": score_list[i],
+            "embedding": embeddings[i],  # float32 ndarray 그대로 (ORJSONResponse가 직렬화)
+        }
+        for i in range(len(embedded))
+    ]
+    return {
+        "faces": payload_faces,
+        "best_embedding": embeddings[best],
+        "best_bbox": bbox_list[best],
+        "best_det_score": score_list[best],
+    }
 
-    best = None
-    best_score = -1e9
-    for f in faces:
-        ds = float(getattr(f, "det_score", 0.0))
-        ar = face_area(f)
-        area_norm = min(1.0, ar / img_area)  # 0~1
-        area_term = (area_norm ** 0.5)       # 작은 얼굴도 완전 죽이지 않도록 sqrt
-        center_term = 1.0 - face_center_distance_norm(f, img_w, img_h)
-
-        score = ds * 0.70 + area_term * 0.25 + center_term * 0.05
-        if score > best_score:
-            best_score = score
-            best = f
-
-    return best
-
-def normalize_embedding(vec: np.ndarray) -> np.ndarray:
-    vec = vec.astype(np.float32)
-    n = float(np.linalg.norm(vec) + 1e-12)
-    return (vec / n).astype(np.float32)
-
-def faces_to_payload(faces: list) -> list:
-    out = []
-    for f in faces:
-        emb = getattr(f, "embedding", None)
-        if emb is None:
-            continue
-        emb = normalize_embedding(np.asarray(emb))
-        out.append({
-            "bbox": [float(x) for x in f.bbox.tolist()],
-            "det_score": float(getattr(f, "det_score", 0.0)),
-            "embedding": emb.tolist(),
-        })
-    return out
+async def read_upload_limited(file: UploadFile, limit: int) -> bytearray:
+    """
+    업로드를 청크 단위로 읽되 limit를 넘으면 바로 413.
+    (bytearray를 그대로 반환해서 bytes로 한 번 더 복사하지 않음)
+    """
+    size = getattr(file, "size", None)
+    if size is not None and size > limit:
+        raise HTTPException(status_code=413, detail="file too large")
+
+    buf = bytearray()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        buf += chunk
+        if len(buf) > limit:
+            raise HTTPException(status_code=413, detail="file too large")
+    return buf
+
+# -----------------------------
+# 응답 캐시 (sha256(파일 bytes) -> /embed 응답, LRU)
+# -----------------------------
+# cache_get/cache_put은 이벤트 루프에서만 호출되고 중간에 await가 없으므로 lock 불필요
+_embed_cache: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+
+def upload_digest(data) -> bytes:
+    # 최대 MAX_UPLOAD_BYTES까지 해싱하므로 기본 스레드풀에서 실행 (hashlib은 GIL을 풂)
+    # 추론용 EXECUTOR에 넣으면 캐시 히트도 추론 작업 뒤에 줄을 서게 됨
+    return hashlib.sha256(data).digest()
+
+def cache_get(key: bytes) -> Optional[Dict[str, Any]]:
+    if EMBED_CACHE_SIZE <= 0:
+        return None
+    hit = _embed_cache.get(key)
+    if hit is not None:
+        _embed_cache.move_to_end(key)
+    return hit
+
+def cache_put(key: bytes, value: Dict[str, Any]) -> None:
+    if EMBED_CACHE_SIZE <= 0:
+        return
+    _embed_cache[key] = value
+    _embed_cache.move_to_end(key)
+    while len(_embed_cache) > EMBED_CACHE_SIZE:
+        _embed_cache.popitem(last=False)
 
 # -----------------------------
 # Detection pipeline (멀티 패스)
 # -----------------------------
-def detect_faces_multi_pass(img: np.ndarray) -> Dict[str, Any]:
+def detect_faces_multi_pass(
+    img_first: np.ndarray,
+    load_full: Optional[Callable[[], Optional[np.ndarray]]],
+) -> Dict[str, Any]:
     """
     여러 det_size / det_thresh로 재시도.
-    실패하면 업스케일로 한 번 더 구출 시도.
+    실패하면 더 큰 det_size로 한 번 더 구출 시도.
+
+    img_first: 1차 패스용 이미지 (FIRST_PASS_LONG_EDGE로 한 번에 축소된 것)
+    load_full: 2차 패스용 ABS_MAX_LONG_EDGE 이미지를 만드는 함수 (1차 실패 시에만 호출)
+               1차 이미지가 축소되지 않았다면 None (원본과 같은 이미지)
     """
     tried = []
 
-    # 0) 절대 크기 제한(메모리 폭발 방지)
-    img0 = resize_long_edge(img, ABS_MAX_LONG_EDGE)
-
-    # 1) 1차 패스: 너무 큰 이미지는 먼저 축소해서 빠르게
-    img_first = resize_long_edge(img0, MAX_LONG_EDGE_FOR_FIRST_PASS)
+    # 1차 패스의 det_size -> detector 결과
+    # 2차 패스 입력이 1차와 같은 이미지면 전처리+SCRFD 추론을 다시 하지 않고 재사용
+    first_detections: Dict[Tuple[int, int], Tuple[np.ndarray, Any]] = {}
 
-    def run_pass(input_img: np.ndarray, phase: str):
+    def run_pass(
+        input_img: np.ndarray,
+        phase: str,
+        det_sizes: List[Tuple[int, int]] = DET_SIZES,
+        detections: Optional[Dict[Tuple[int, int], Tuple[np.ndarray, Any]]] = None,
+    ):
         h, w = input_img.shape[:2]
-        for det_size in DET_SIZES:
+        fa = get_face_app()
+        for det_size in det_sizes:
+            # SCRFD 추론은 det_size당 1회. NMS는 점수 내림차순이라
+            # 낮은 임계치 결과를 필터링해도 각 임계치로 돌린 결과와 동일함
+            if detections is not None and det_size in detections:
+                all_bboxes, all_kpss = detections[det_size]
+            else:
+                all_bboxes, all_kpss = detect_candidates(fa, input_img, det_size)
+                if detections is not None:
+                    detections[det_size] = (all_bboxes, all_kpss)
             for det_thresh in DET_THRESH_SCHEDULE:
-                fa = get_face_app(det_size, det_thresh)
-                faces = fa.get(input_img)
+                mask = all_bboxes[:, 4] >= det_thresh
+                n = int(mask.sum())
                 tried.append({
                     "phase": phase,
                     "det_size": list(det_size),
                     "det_thresh": float(det_thresh),
                     "img_w": int(w),
                     "img_h": int(h),
-                    "faces": int(len(faces) if faces else 0),
+                    "faces": n,
                 })
-                if faces and len(faces) > 0:
-                    return input_img, faces
+                if n > 0:
+                    kpss = all_kpss[mask] if all_kpss is not None else None
+                    return input_img, embed_candidates(fa, input_img, all_bboxes[mask], kpss)
         return input_img, []
 
     # 1차
-    used_img, faces = run_pass(img_first, "first")
+    used_img, faces = run_pass(img_first, "first", detections=first_detections)
     if faces:
         return {"img": used_img, "faces": faces, "tried": tried}
 
     # 2차: 원본(ABS_MAX 제한만 적용한 이미지)로 다시 시도
-    used_img, faces = run_pass(img0, "full")
+    # 1차 이미지가 축소되지 않았다면 원본과 같으므로 다시 디코딩하지 않음
+    img0 = load_full() if load_full is not None else None
+    if img0 is None:
+        img0 = img_first
+    used_img, faces = run_pass(img0, "full", detections=first_detections if img0 is img_first else None)
     if faces:
         return {"img": used_img, "faces": faces, "tried": tried}
 
-    # 3차: 업스케일로 작은 얼굴 구출
-    up = upscale(img0, UPSCALE_ON_FAIL)
-    used_img, faces = run_pass(up, "upscale")
+    # 3차: 큰 det_size로 작은 얼굴 구출
+    # (이미지를 업스케일하면 detector가 어차피 det_size로 다시 줄이므로,
+    #  확대된 중간 이미지 없이 detector 입력 해상도를 직접 올림)
+    used_img, faces = run_pass(img0, "upscale", RESCUE_DET_SIZES)
     return {"img": used_img, "faces": faces, "tried": tried}
 
 # -----------------------------
 # API
 # -----------------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 모델 로딩 + warmup을 서버 시작 시점에 해서 첫 요청 지연을 없앰
+    if WARMUP_ON_STARTUP:
+        get_face_app()
+    yield
+    EXECUTOR.shutdown(wait=False)
+
+app = FastAPI(lifespan=lifespan)
+
+# CPU-bound 추론을 이벤트 루프 밖에서 실행 (추론 중에도 /health 등 응답 가능)
+EXECUTOR = ThreadPoolExecutor(max_workers=EMBED_WORKERS, thread_name_prefix="embed")
+
 @app.get("/health")
 def health():
     return {"ok": True}
 
-@app.post("/embed")
+@app.post("/embed", response_class=ORJSONResponse)
 async def embed(file: UploadFile = File(...)):
-    data = await file.read()
+    data = await read_upload_limited(file, MAX_UPLOAD_BYTES)
     if not data:
         raise HTTPException(status_code=400, detail="empty file")
 
-    img = imdecode_bytes(data)
+    # 같은 이미지 재요청(재시도/재인덱싱)은 파이프라인을 건너뛰고 캐시에서 응답
+    key = await asyncio.to_thread(upload_digest, data)
+    cached = cache_get(key)
+    if cached is not None:
+        return ORJSONResponse(cached)
+
+    result = await asyncio.get_running_loop().run_in_executor(EXECUTOR, embed_bytes, data)
+    cache_put(key, result)
+    # dict를 그대로 반환하면 FastAPI의 jsonable_encoder가 ndarray를 처리하지 못하므로 직접 응답 생성
+    return ORJSONResponse(result)
+
+def embed_bytes(data) -> Dict[str, Any]:
+    """
+    업로드 bytes -> /embed 응답 dict (디코딩 + 탐지 + 임베딩)
+    """
+    # 1차 패스 크기로 바로 디코딩+축소 (ABS_MAX -> FIRST_PASS 2단계 resize 없음)
+    img, downscaled = imdecode_bytes(data, FIRST_PASS_LONG_EDGE)
     if img is None:
         raise HTTPException(status_code=400, detail="invalid image")
 
-    # 탐지
-    result = detect_faces_multi_pass(img)
+    # 탐지 (2차 패스가 필요할 때만 ABS_MAX_LONG_EDGE로 다시 디코딩)
+    # 1차에서 축소되지 않았거나 두 한도가 같으면 다시 디코딩해도 같은 이미지
+    load_full = None
+    if downscaled and FIRST_PASS_LONG_EDGE < ABS_MAX_LONG_EDGE:
+        load_full = lambda: imdecode_bytes(data, ABS_MAX_LONG_EDGE)[0]
+    result = detect_faces_multi_pass(img, load_full)
     faces = result["faces"]
     tried = result["tried"]
     used_img = result["img"]
@@ -243,10 +574,10 @@ async def embed(file: UploadFile = File(...)):
             "img_h": int(h),
         }
 
-    # faces -> payload(embedding 포함)
-    payload_faces = faces_to_payload(faces)
+    # faces -> payload(embedding 포함) + 대표 얼굴 선택
+    built = build_response(faces, w, h)
 
-    if not payload_faces:
+    if built is None:
         return {
             "ok": True,
             "faces": [],
@@ -257,29 +588,14 @@ async def embed(file: UploadFile = File(...)):
             "img_h": int(h),
         }
 
-    # 대표 얼굴 선택
-    best_face = pick_best_face(faces, w, h)
-    best_embedding = None
-    best_bbox = None
-    best_det_score = None
-
-    if best_face is not None and getattr(best_face, "embedding", None) is not None:
-        be = normalize_embedding(np.asarray(best_face.embedding))
-        best_embedding = be.tolist()
-        best_bbox = [float(x) for x in best_face.bbox.tolist()]
-        best_det_score = float(getattr(best_face, "det_score", 0.0))
-    else:
-        # fallback: payload_faces[0]
-        best_embedding = payload_faces[0]["embedding"]
-        best_bbox = payload_faces[0]["bbox"]
-        best_det_score = payload_faces[0]["det_score"]
+    payload_faces = built["faces"]
 
     return {
         "ok": True,
         "faces": payload_faces,               # (기존 호환) faces[0].embedding 사용 가능
-        "best_embedding": best_embedding,     # (신규) 대표 임베딩을 명시적으로 제공
-        "best_bbox": best_bbox,
-        "best_det_score": best_det_score,
+        "best_embedding": built["best_embedding"],  # (신규) 대표 임베딩을 명시적으로 제공
+        "best_bbox": built["best_bbox"],
+        "best_det_score": built["best_det_score"],
         "faces_count": int(len(payload_faces)),
         "tried": tried,                       # 어떤 설정으로 몇 번 시도했는지 디버깅 가능
         "img_w": int(w),
@@ -0,0 +1,47 @@
+"""
+onnx 모델 종류 판별 + detection/recognition 선택 (onnxruntime/insightface 의존성 없음)
+"""
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+
+def model_taskname(session) -> Optional[str]:
+    """
+    insightface model_zoo.ModelRouter와 같은 순서/기준으로 onnx 모델 종류 판별.
+    landmark(192x192), attribute(96x96), inswapper(입력 2개, 128x128)는
+    ArcFace 조건(정사각형, 112 이상, 16의 배수)에도 걸리므로 먼저 걸러야 함.
+    반환: "detection" / "recognition" / None(그 외)
+    """
+    inputs = session.get_inputs()
+    input_shape = inputs[0].shape
+    if len(session.get_outputs()) >= 5:
+        return "detection"
+    h, w = input_shape[2], input_shape[3]
+    if h == 192 and w == 192:
+        return None  # landmark (1k3d68, 2d106det)
+    if h == 96 and w == 96:
+        return None  # attribute (genderage)
+    if len(inputs) == 2 and h == 128 and w == 128:
+        return None  # inswapper
+    if isinstance(h, int) and h == w and h >= 112 and h % 16 == 0:
+        return "recognition"
+    return None
+
+
+def select_models(
+    onnx_files: Iterable[str],
+    open_session: Callable[[str], Any],
+    allowed_modules: Iterable[str],
+) -> Dict[str, Tuple[str, Any]]:
+    """
+    onnx 파일마다 세션을 열어 종류를 판별하고, 허용된 종류별로 처음 나온 것 하나만 선택.
+    반환: taskname -> (onnx_file, session). 선택되지 않은 세션은 바로 버림.
+    """
+    allowed = set(allowed_modules)
+    selected: Dict[str, Tuple[str, Any]] = {}
+    for onnx_file in onnx_files:
+        session = open_session(onnx_file)
+        taskname = model_taskname(session)
+        if taskname not in allowed or taskname in selected:
+            continue
+        selected[taskname] = (onnx_file, session)
+    return selected
@@ -0,0 +1,54 @@
+"""
+buffalo_l의 detection/recognition 모델을 int8(dynamic quantization)으로 변환해서
+별도 모델 팩(기본: buffalo_l_int8)으로 저장.
+
+Docker 빌드 시 1회 실행:
+    python quantize_models.py                  # 다운로드 + 양자화
+    python quantize_models.py --download-only  # buffalo_l 다운로드만 (FP32 기본 배포)
+이후 INSIGHTFACE_MODEL=buffalo_l_int8 로 지정하면 main.py가 양자화 모델을 사용. (opt-in, 기본은 FP32)
+
+주의:
+- dynamic quantization은 Conv를 DynamicQuantizeLinear + ConvInteger로 바꾸는데,
+  CPU에 따라 FP32보다 오히려 느릴 수 있음 → 배포 전 해당 하드웨어에서 latency 측정 필요
+- 임베딩 값이 FP32 모델과 달라지므로 이미 저장된 FP32 임베딩과 비교하면 안 됨
+"""
+import argparse
+import os
+import os.path as osp
+
+from insightface.utils.storage import ensure_available
+from onnxruntime.quantization import QuantType, quantize_dynamic
+
+SRC_MODEL_NAME = os.getenv("INSIGHTFACE_SRC_MODEL", "buffalo_l")
+DST_MODEL_NAME = os.getenv("INSIGHTFACE_INT8_MODEL", SRC_MODEL_NAME + "_int8")
+INSIGHTFACE_ROOT = os.path.expanduser(os.getenv("INSIGHTFACE_ROOT", "~/.insightface"))
+
+# /embed에서 실제로 쓰는 모델만 (detection, recognition)
+# main.py의 load_face_app은 파일명이 아니라 입력/출력 shape로 모델 종류를 고르므로(model_router.py)
+# 양자화 후에도 shape만 같으면 됨. 파일명은 원본과 같게 유지 (정렬 순서/식별 편의)
+MODEL_FILES = ["det_10g.onnx", "w600k_r50.onnx"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--download-only", action="store_true", help="모델 팩 다운로드만 하고 양자화는 생략")
+    args = parser.parse_args()
+
+    src_dir = ensure_available("models", SRC_MODEL_NAME, root=INSIGHTFACE_ROOT)
+    if args.download_only:
+        print(f"downloaded: {src_dir}")
+        return
+
+    dst_dir = osp.join(INSIGHTFACE_ROOT, "models", DST_MODEL_NAME)
+    os.makedirs(dst_dir, exist_ok=True)
+
+    for fname in MODEL_FILES:
+        src = osp.join(src_dir, fname)
+        dst = osp.join(dst_dir, fname)
+        # CPU의 ConvInteger 커널은 uint8 weight만 지원 -> QUInt8
+        quantize_dynamic(src, dst, weight_type=QuantType.QUInt8)
+        print(f"quantized: {src} -> {dst}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import struct
+import unittest
+
+from exif import jpeg_exif_orientation
+
+
+def make_jpeg(orientation=None, byte_order="II", with_app0=True, extra_tags=()):
+    """
+    SOI + (APP0) + APP1(Exif, IFD0) + SOS 헤더만 있는 최소 JPEG bytes
+    """
+    fmt = "<" if byte_order == "II" else ">"
+    tags = list(extra_tags)
+    if orientation is not None:
+        tags.append((0x0112, 3, 1, orientation))  # SHORT 1개
+
+    ifd = struct.pack(fmt + "H", len(tags))
+    for tag, typ, count, value in tags:
+        # SHORT 값은 value 필드의 앞 2바이트에 들어감
+        ifd += struct.pack(fmt + "HHIHH", tag, typ, count, value, 0)
+    ifd += b"\x00\x00\x00\x00"  # next IFD offset
+
+    tiff = byte_order.encode() + struct.pack(fmt + "HI", 42, 8) + ifd
+    app1_body = b"Exif\x00\x00" + tiff
+
+    out = b"\xff\xd8"
+    if with_app0:
+        app0_body = b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+        out += b"\xff\xe0" + struct.pack(">H", len(app0_body) + 2) + app0_body
+    out += b"\xff\xe1" + struct.pack(">H", len(app1_body) + 2) + app1_body
+    out += b"\xff\xda\x00\x02"
+    return out
+
+
+class JpegExifOrientationTest(unittest.TestCase):
+    def test_all_orientations_little_endian(self):
+        for o in range(1, 9):
+            self.assertEqual(jpeg_exif_orientation(make_jpeg(o, "II")), o)
+
+    def test_all_orientations_big_endian(self):
+        for o in range(1, 9):
+            self.assertEqual(jpeg_exif_orientation(make_jpeg(o, "MM")), o)
+
+    def test_app1_first_segment(self):
+        self.assertEqual(jpeg_exif_orientation(make_jpeg(6, with_app0=False)), 6)
+
+    def test_orientation_after_other_tags(self):
+        data = make_jpeg(8, extra_tags=[(0x010F, 2, 4, 0), (0x0110, 2, 4, 0)])
+        self.assertEqual(jpeg_exif_orientation(data), 8)
+
+    def test_exif_without_orientation(self):
+        data = make_jpeg(None, extra_tags=[(0x010F, 2, 4, 0)])
+        self.assertEqual(jpeg_exif_orientation(data), 1)
+
+    def test_no_exif(self):
+        self.assertEqual(jpeg_exif_orientation(b"\xff\xd8\xff\xda\x00\x02"), 1)
+
+    def test_bytearray_input(self):
+        self.assertEqual(jpeg_exif_orientation(bytearray(make_jpeg(3))), 3)
+
+    def test_truncated_does_not_raise(self):
+        data = make_jpeg(6)
+        for cut in range(len(data)):
+            jpeg_exif_orientation(data[:cut])
+
+
+if __name__ == "__main__":
+    unittest.main()
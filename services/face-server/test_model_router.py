@@ -0,0 +1,82 @@
+import unittest
+from types import SimpleNamespace
+
+from model_router import model_taskname, select_models
+
+
+class StubSession:
+    def __init__(self, input_shapes, n_outputs):
+        self._inputs = [SimpleNamespace(shape=s) for s in input_shapes]
+        self._outputs = [SimpleNamespace(shape=None) for _ in range(n_outputs)]
+
+    def get_inputs(self):
+        return self._inputs
+
+    def get_outputs(self):
+        return self._outputs
+
+
+# buffalo_l 모델 팩의 실제 입력/출력 shape
+BUFFALO_L = {
+    "1k3d68.onnx": StubSession([[None, 3, 192, 192]], 1),
+    "2d106det.onnx": StubSession([[None, 3, 192, 192]], 1),
+    "det_10g.onnx": StubSession([[1, 3, "?", "?"]], 9),
+    "genderage.onnx": StubSession([[None, 3, 96, 96]], 1),
+    "w600k_r50.onnx": StubSession([[None, 3, 112, 112]], 1),
+}
+
+
+class ModelTasknameTest(unittest.TestCase):
+    def test_buffalo_l_shapes(self):
+        expected = {
+            "1k3d68.onnx": None,
+            "2d106det.onnx": None,
+            "det_10g.onnx": "detection",
+            "genderage.onnx": None,
+            "w600k_r50.onnx": "recognition",
+        }
+        for name, session in BUFFALO_L.items():
+            self.assertEqual(model_taskname(session), expected[name], name)
+
+    def test_inswapper_is_not_recognition(self):
+        session = StubSession([[1, 3, 128, 128], [1, 512]], 1)
+        self.assertIsNone(model_taskname(session))
+
+    def test_single_input_128_is_recognition(self):
+        self.assertEqual(model_taskname(StubSession([[None, 3, 128, 128]], 1)), "recognition")
+
+    def test_dynamic_spatial_dims_are_not_recognition(self):
+        self.assertIsNone(model_taskname(StubSession([[None, 3, "h", "w"]], 1)))
+
+
+class SelectModelsTest(unittest.TestCase):
+    def test_buffalo_l_selects_det_and_arcface(self):
+        opened = []
+
+        def open_session(f):
+            opened.append(f)
+            return BUFFALO_L[f]
+
+        selected = select_models(sorted(BUFFALO_L), open_session, ["detection", "recognition"])
+
+        self.assertEqual(opened, sorted(BUFFALO_L))
+        self.assertEqual(set(selected), {"detection", "recognition"})
+        self.assertEqual(selected["detection"][0], "det_10g.onnx")
+        self.assertEqual(selected["recognition"][0], "w600k_r50.onnx")
+        self.assertIs(selected["recognition"][1], BUFFALO_L["w600k_r50.onnx"])
+
+    def test_allowed_modules_filter(self):
+        selected = select_models(sorted(BUFFALO_L), BUFFALO_L.__getitem__, ["detection"])
+        self.assertEqual(set(selected), {"detection"})
+
+    def test_first_match_wins(self):
+        files = {
+            "a_rec.onnx": StubSession([[None, 3, 112, 112]], 1),
+            "b_rec.onnx": StubSession([[None, 3, 112, 112]], 1),
+        }
+        selected = select_models(sorted(files), files.__getitem__, ["recognition"])
+        self.assertEqual(selected["recognition"][0], "a_rec.onnx")
+
+
+if __name__ == "__main__":
+    unittest.main()